@@ -3,8 +3,8 @@
 set thresholds by player surname, list/remove thresholds, and notify on drops.
 
 Setup:
-1. Python 3.8+
-2. pip3 install python-telegram-bot requests
+1. Python 3.11+
+2. pip3 install "python-telegram-bot[job-queue]" aiohttp
 3. python3 bot.py
 """
 # Helper: Get matched volume
@@ -18,30 +18,33 @@ def get_play_count(mkt: dict) -> int:
     Returns the number of distinct betting markets for the chosen popular bookmaker (Bet365),
     or falls back to the bookmaker with the most markets.
     """
-    bookmakers = mkt.get('bookmakers', [])
-    # Try to find the popular bookmaker “bet365”
-    for bk in bookmakers:
+    # Single pass: return on the first “bet365” hit, otherwise fall back
+    # to the bookmaker with the most markets (proxy for bet variety)
+    best_len = 0
+    for bk in mkt.get('bookmakers', ()):
+        n = len(bk.get('markets', ()))
         if 'bet365' in bk.get('key', '').lower():
-            return len(bk.get('markets', []))
-    # Fallback: choose the bookmaker with the most markets (proxy for bet variety)
-    if not bookmakers:
-        return 0
-    best = max(bookmakers, key=lambda b: len(b.get('markets', [])))
-    return len(best.get('markets', []))
+            return n
+        if n > best_len:
+            best_len = n
+    return best_len
 import sys
+import functools
+import heapq
+import random
 import logging
-import requests
-from requests.exceptions import RequestException
 import re
 from datetime import datetime, timedelta, timezone
 from telegram import Update
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, ContextTypes, CallbackContext
-from telegram import Bot as SyncBot
-import json
+from telegram.error import RetryAfter
+import os
+import orjson
+from collections import namedtuple
 from pathlib import Path
-import subprocess
 import time
 import asyncio
+import aiohttp
 
 # Fixed GMT+2 timezone (no DST)
 GMT_PLUS_2 = timezone(timedelta(hours=2))
@@ -52,37 +55,62 @@ THRESHOLDS_FILE = Path(__file__).parent / 'thresholds.json'
 def load_thresholds():
     global thresholds
     try:
-        with open(THRESHOLDS_FILE, 'r') as f:
-            thresholds = json.load(f)
+        thresholds = orjson.loads(THRESHOLDS_FILE.read_bytes())
     except FileNotFoundError:
         thresholds = {}
-    except json.JSONDecodeError:
+    except orjson.JSONDecodeError:
         thresholds = {}
+    # JSON keys are always strings; chat ids are ints everywhere at runtime
+    thresholds = {int(chat): user_th for chat, user_th in thresholds.items()}
+    # Backfill the cached lowercase surname for entries saved by older versions
+    for user_th in thresholds.values():
+        for thr in user_th:
+            thr.setdefault('surname_lc', thr['surname'].lower())
+    rebuild_threshold_index()
+
+def save_thresholds_local():
+    THRESHOLDS_FILE.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a tmp file and atomically replace so a crash mid-write
+    # can't leave a truncated thresholds.json behind
+    tmp = THRESHOLDS_FILE.with_suffix('.json.tmp')
+    tmp.write_bytes(orjson.dumps(thresholds, option=orjson.OPT_NON_STR_KEYS))
+    os.replace(tmp, THRESHOLDS_FILE)
+
+# Flag drained by git_push_job so threshold writes never block on git
+_push_pending = False
+
+def schedule_push():
+    global _push_pending
+    _push_pending = True
 
 def save_thresholds():
-    THRESHOLDS_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with open(THRESHOLDS_FILE, 'w') as f:
-        json.dump(thresholds, f)
-    # commit the updated thresholds file and push
-    commit_and_push()
+    save_thresholds_local()
+    schedule_push()
 
-def commit_and_push():
-    try:
-        cwd = Path(__file__).parent
-        subprocess.run(["git", "add", str(THRESHOLDS_FILE.name)], cwd=cwd, check=True)
-        subprocess.run(["git", "commit", "-m", "Persist thresholds update"], cwd=cwd, check=True)
-        subprocess.run(["git", "push", "origin", "main"], cwd=cwd, check=True)
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Git push failed: {e}")
+async def git_push_job(context) -> None:
+    """Repeating job: commit and push thresholds.json if it changed since the last run."""
+    global _push_pending
+    if not _push_pending:
+        return
+    _push_pending = False
+    cwd = Path(__file__).parent
+    for cmd in (["git", "add", str(THRESHOLDS_FILE.name)],
+                ["git", "commit", "-m", "Persist thresholds update"],
+                ["git", "push", "origin", "main"]):
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, cwd=cwd,
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await proc.communicate()
+        if proc.returncode != 0:
+            logger.error(f"Git push failed at {' '.join(cmd[:2])}: {stderr.decode().strip()}")
+            return
 
 # ======== Config ========
 TELEGRAM_TOKEN = '7495330094:AAF1-3HvNMyYft2jI1d0QZL3tTiDyQ0cx1c'
 ODDS_API_KEY   = '260567c3535bb5e28f0243d42a7396f6'
 SPORT_KEY      = 'tennis'
 
-# synchronous bot used inside threads for alerts
-sync_bot = SyncBot(token=TELEGRAM_TOKEN)
-
 # Validate credentials
 if not TELEGRAM_TOKEN or ' ' in TELEGRAM_TOKEN:
     print("Invalid TELEGRAM_TOKEN")
@@ -95,89 +123,333 @@ if not ODDS_API_KEY:
 logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# In-memory thresholds: chat_id -> list of {'surname': str, 'threshold': float}
+# In-memory thresholds: chat_id -> list of {'surname': str, 'surname_lc': str, 'threshold': float}
 thresholds = {}
-
-# Helper: 'F. Lastname'
+# Secondary index mirroring `thresholds`, keyed by surname globally:
+# surname_lc -> chat_id -> list of threshold records. The watcher walks
+# this directly, so a tick costs O(watched surnames), not O(chats x thresholds)
+_thr_index: dict[str, dict[int, list[dict]]] = {}
+# Guards concurrent mutation of `thresholds` (handlers run concurrently
+# and the watcher job mutates it too)
+_thresholds_lock = asyncio.Lock()
+
+def add_threshold(chat: int, surname: str, price: float) -> dict:
+    thr = {'surname': surname, 'surname_lc': surname.lower(), 'threshold': price}
+    thresholds.setdefault(chat, []).append(thr)
+    _thr_index.setdefault(thr['surname_lc'], {}).setdefault(chat, []).append(thr)
+    return thr
+
+def remove_threshold_entry(chat: int, thr: dict) -> None:
+    """Drop one specific threshold record from both structures."""
+    chats = _thr_index.get(thr['surname_lc'])
+    if chats is not None:
+        entries = chats.get(chat)
+        if entries is not None:
+            try:
+                entries.remove(thr)
+            except ValueError:
+                pass
+            if not entries:
+                chats.pop(chat)
+        if not chats:
+            _thr_index.pop(thr['surname_lc'])
+    user_th = thresholds.get(chat)
+    if user_th is not None:
+        try:
+            user_th.remove(thr)
+        except ValueError:
+            pass
+
+def remove_threshold_entries(chat: int, surname_lc: str) -> bool:
+    """Drop every threshold a chat holds for a surname. Returns True if any existed."""
+    chats = _thr_index.get(surname_lc)
+    if not chats or chats.pop(chat, None) is None:
+        return False
+    if not chats:
+        _thr_index.pop(surname_lc)
+    user_th = thresholds.get(chat)
+    if user_th:
+        thresholds[chat] = [t for t in user_th if t['surname_lc'] != surname_lc]
+    return True
+
+def remove_all_thresholds(chat: int) -> None:
+    thresholds.pop(chat, None)
+    for surname_lc in list(_thr_index):
+        _thr_index[surname_lc].pop(chat, None)
+        if not _thr_index[surname_lc]:
+            _thr_index.pop(surname_lc)
+
+def rebuild_threshold_index() -> None:
+    _thr_index.clear()
+    for chat, user_th in thresholds.items():
+        for thr in user_th:
+            _thr_index.setdefault(thr['surname_lc'], {}).setdefault(chat, []).append(thr)
+
+# Helper: 'F. Lastname' — memoized, the same players recur across
+# markets and across repeated /t10t calls
+@functools.lru_cache(maxsize=2048)
 def format_name(full_name: str) -> str:
-    parts = full_name.split()
-    return f"{parts[0][0]}. {parts[-1]}" if parts else full_name
+    first = full_name.partition(' ')[0]
+    if not first:
+        return full_name
+    return f"{first[0]}. {full_name.rpartition(' ')[2]}"
+
+@functools.lru_cache(maxsize=2048)
+def surname_lc(full_name: str) -> str:
+    return full_name.rpartition(' ')[2].lower()
+
+# Shared aiohttp session, created once the event loop is running (see post_init)
+http_session: aiohttp.ClientSession = None
+
+HTTP_TIMEOUT = aiohttp.ClientTimeout(total=10)
+
+def _make_http_session() -> aiohttp.ClientSession:
+    # Pooled, keep-alive connections: the sports-list GET and all per-key
+    # GETs hit the same host, so reusing sockets skips the TCP/TLS
+    # handshakes on every refresh
+    return aiohttp.ClientSession(
+        timeout=HTTP_TIMEOUT,
+        connector=aiohttp.TCPConnector(limit=16, limit_per_host=16, keepalive_timeout=60),
+    )
+
+async def post_init(application) -> None:
+    global http_session
+    http_session = _make_http_session()
+
+async def post_shutdown(application) -> None:
+    if http_session is not None:
+        await http_session.close()
+
+# The sports catalog changes on the order of days; cache the filtered
+# tennis keys for an hour instead of re-downloading it every cycle
+_sports_cache = {"keys": None, "expires_at": 0.0}
+
+async def get_tennis_keys(ttl=3600):
+    if _sports_cache["keys"] is not None and time.monotonic() < _sports_cache["expires_at"]:
+        return _sports_cache["keys"]
+    url_sports = 'https://api.the-odds-api.com/v4/sports'
+    async with http_session.get(url_sports, params={'apiKey': ODDS_API_KEY}) as r:
+        r.raise_for_status()
+        all_sports = await r.json(loads=orjson.loads)  # list of { key, title, ... }
+    keys = [s['key'] for s in all_sports if s['key'].lower().startswith('tennis')]
+    _sports_cache["keys"] = keys
+    _sports_cache["expires_at"] = time.monotonic() + ttl
+    return keys
 
 # Fetch raw market data
-def fetch_markets():
+async def fetch_markets():
     """
     Pulls all tennis-related markets by first getting every sport_key
     starting with 'tennis' (so ATP, WTA, Slams, etc.), then fetching
     odds for each and flattening the results.
     """
-    # 1) get all sport keys
-    url_sports = 'https://api.the-odds-api.com/v4/sports'
-    params = {'apiKey': ODDS_API_KEY}
-    r = requests.get(url_sports, params=params, timeout=10)
-    r.raise_for_status()
-    all_sports = r.json()  # list of { key, title, ... }
-
-    # 2) pick only those whose key starts with "tennis"
-    tennis_keys = [s['key'] for s in all_sports if s['key'].lower().startswith('tennis')]
+    tennis_keys = await get_tennis_keys()
     if not tennis_keys:
         logger.warning("No tennis sport keys found in sports list.")
         return []
 
-    # 3) for each tennis key, fetch its markets
-    all_markets = []
-    for sk in tennis_keys:
-        url_odds = f'https://api.the-odds-api.com/v4/sports/{sk}/odds/'
-        try:
-            r2 = requests.get(url_odds, params={
-                'regions': 'uk,us,eu,au',
-                'markets': 'h2h',
-                'apiKey': ODDS_API_KEY
-            }, timeout=10)
-            if r2.status_code == 401:
-                logger.error(f"Unauthorized for sport key {sk}.")
-                continue
-            if r2.status_code == 422:
-                logger.error(f"Unprocessable for sport key {sk}.")
-                continue
-            r2.raise_for_status()
-            data = r2.json() or []
-            logger.info(f"Fetched {len(data)} markets for {sk}")
-            all_markets.extend(data)
-        except RequestException as e:
-            logger.error(f"Error fetching odds for {sk}: {e}")
-            continue
+    # 3) fetch every tennis key's markets concurrently — wall time is
+    # max(latency) instead of sum(latency)
+    results = await asyncio.gather(*(_fetch_odds_for_key(sk) for sk in tennis_keys))
+    all_markets = [m for data in results for m in data]
 
     if not all_markets:
         logger.warning("No tennis markets returned across all tennis keys.")
     return all_markets
 
+def _slim_market(m: dict) -> dict:
+    """Project a raw Odds API market down to the fields this bot reads.
+    The TTL cache holds these for every market, so dropping the unused
+    bulk (titles, timestamps, other market types' metadata) keeps the
+    resident set small."""
+    return {
+        'commence_time': m.get('commence_time'),
+        'home_team': m.get('home_team'),
+        'away_team': m.get('away_team'),
+        'bookmakers': [
+            {
+                'key': bk.get('key', ''),
+                'markets': [
+                    {'outcomes': [{'name': o.get('name'), 'price': o.get('price')}
+                                  for o in mk.get('outcomes', [])]}
+                    for mk in bk.get('markets', [])
+                ],
+            }
+            for bk in m.get('bookmakers', [])
+        ],
+    }
+
+async def _fetch_odds_for_key(sk: str) -> list:
+    url_odds = f'https://api.the-odds-api.com/v4/sports/{sk}/odds/'
+    try:
+        async with http_session.get(url_odds, params={
+            'regions': 'uk,us,eu,au',
+            'markets': 'h2h',
+            'apiKey': ODDS_API_KEY
+        }) as r:
+            if r.status == 401:
+                logger.error(f"Unauthorized for sport key {sk}.")
+                return []
+            if r.status == 422:
+                logger.error(f"Unprocessable for sport key {sk}.")
+                return []
+            r.raise_for_status()
+            data = await r.json(loads=orjson.loads) or []
+        logger.info(f"Fetched {len(data)} markets for {sk}")
+        return [_slim_market(m) for m in data]
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"Error fetching odds for {sk}: {e}")
+        return []
+
+async def fetch_markets_with_backoff(retries=5):
+    """
+    Call fetch_markets(), retrying with exponential backoff + jitter when
+    the Odds API answers 429 or 5xx. Honours a Retry-After header if sent.
+    """
+    for attempt in range(retries):
+        try:
+            return await fetch_markets()
+        except aiohttp.ClientResponseError as e:
+            if attempt == retries - 1:
+                raise
+            if e.status == 429:
+                retry_after = e.headers.get('Retry-After') if e.headers else None
+                delay = int(retry_after) if retry_after else 2 ** attempt
+            elif 500 <= e.status < 600:
+                delay = 2 ** attempt
+            else:
+                raise
+            logger.warning(f"Odds API returned {e.status}; retrying in ~{delay}s")
+            await asyncio.sleep(delay + random.random())
+
+# In-process TTL cache for market data so the watcher and handlers
+# don't each pay a full Odds API round-trip for identical data
+_markets_cache = {"data": None, "expires_at": 0.0}
+# Single-flight guard: concurrent callers on a cold/expired cache wait
+# for the one in-flight fetch instead of each hitting the Odds API
+_markets_fetch_lock = asyncio.Lock()
+
+async def fetch_markets_cached(ttl=15):
+    """
+    Returns fetch_markets() output, cached for `ttl` seconds.
+    On a fetch error, falls back to the last stale payload (if any)
+    so transient Odds API hiccups don't break the watcher or handlers.
+    """
+    if _markets_cache["data"] is not None and time.monotonic() < _markets_cache["expires_at"]:
+        return _markets_cache["data"]
+    async with _markets_fetch_lock:
+        # another caller may have refreshed the cache while we waited
+        if _markets_cache["data"] is not None and time.monotonic() < _markets_cache["expires_at"]:
+            return _markets_cache["data"]
+        try:
+            data = await fetch_markets_with_backoff()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if _markets_cache["data"] is not None:
+                logger.warning(f"Market fetch failed ({e}); serving stale cached data")
+                return _markets_cache["data"]
+            raise
+        _markets_cache["data"] = data
+        _markets_cache["expires_at"] = time.monotonic() + ttl
+        return data
+
+# The filtered/sorted/normalized projection is deterministic per raw
+# payload, so cache it alongside the fetch cache instead of rebuilding
+# it on every call
+_top7_cache = {"source": None, "data": None}
+
+def invalidate_top7():
+    """Force the next get_top7_markets() call to refetch from the Odds API."""
+    _markets_cache["expires_at"] = 0.0
+    _top7_cache["source"] = None
+
 # Get top 7 markets within next 3 days
-def get_top7_markets():
-    data = fetch_markets()
+async def get_top7_markets():
+    data = await fetch_markets_cached()
+    if _top7_cache["source"] is not data:
+        _top7_cache["source"] = data
+        _top7_cache["data"] = _top7_from_markets(data)
+    return _top7_cache["data"]
+
+# Normalized view of one match: everything downstream code reads,
+# extracted from the raw Odds API JSON exactly once
+Match = namedtuple(
+    'Match',
+    'home away home_surname_lc away_surname_lc home_price away_price home_lay away_lay dt_utc play_count'
+)
+
+def _normalize_market(m: dict, dt_utc, play_count: int) -> Match:
+    home = m.get('home_team', 'Unknown')
+    away = m.get('away_team', 'Unknown')
+    try:
+        outcomes = m['bookmakers'][0]['markets'][0]['outcomes']
+    except (IndexError, KeyError):
+        outcomes = []
+    prices = {o['name']: o['price'] for o in outcomes}
+    home_price = prices.get(home, 'N/A')
+    away_price = prices.get(away, 'N/A')
+
+    # Exchange odds (lay) from any bookmaker whose key contains "exchange"
+    ex_bk = next((b for b in m.get('bookmakers', []) if 'exchange' in b.get('key', '').lower()), None)
+    if ex_bk and ex_bk.get('markets'):
+        ex_prices = {o['name']: o['price'] for o in ex_bk['markets'][0]['outcomes']}
+        home_lay = ex_prices.get(home, 'N/A')
+        away_lay = ex_prices.get(away, 'N/A')
+    else:
+        home_lay = away_lay = 'N/A'
+
+    return Match(
+        home, away, surname_lc(home), surname_lc(away),
+        home_price, away_price, home_lay, away_lay, dt_utc, play_count
+    )
+
+def _top7_from_markets(data):
     now_utc = datetime.now(timezone.utc)
     cutoff = now_utc + timedelta(days=3)
     upcoming = []
     for m in data:
         try:
-            dt_utc = datetime.fromisoformat(m['commence_time'].replace('Z', '+00:00')).astimezone(timezone.utc)
-            if now_utc <= dt_utc <= cutoff:
-                upcoming.append((m, dt_utc))
-        except:
+            # Py3.11+ fromisoformat parses the trailing 'Z' natively
+            dt_utc = datetime.fromisoformat(m['commence_time'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        if dt_utc.tzinfo is None:
+            dt_utc = dt_utc.replace(tzinfo=timezone.utc)
+        if not (now_utc <= dt_utc <= cutoff):
             continue
-    top7 = sorted(
-        upcoming,
-        key=lambda x: (-get_play_count(x[0]), x[1])
-    )[:7]
-    return top7
-
-async def check_single_threshold(chat: int, surname: str, thr_price: float, send_func):
-    top7 = get_top7_markets()
-    surname_lc = surname.lower()
-    for mkt, _ in top7:
-        for o in mkt['bookmakers'][0]['markets'][0]['outcomes']:
-            if o['name'].lower().split()[-1] == surname_lc and o['price'] <= thr_price:
-                await send_func(chat, surname, o['price'], thr_price)
-                return True
+        # Compute the sort key once and drop markets with no bookmaker
+        # data — they'd only render as all-N/A rows downstream
+        pc = get_play_count(m)
+        if pc == 0:
+            continue
+        upcoming.append((m, dt_utc, pc))
+    # O(N log 7) selection instead of sorting the whole list
+    top7 = heapq.nsmallest(7, upcoming, key=lambda x: (-x[2], x[1]))
+    return [_normalize_market(m, dt_utc, pc) for m, dt_utc, pc in top7]
+
+def build_surname_price_index(top7):
+    """Map surname (lowercased) -> (price, match), so threshold checks
+    become a single dict lookup instead of a triple-nested scan.
+    If a surname appears in several matches, the lowest price wins so a
+    breach anywhere is caught."""
+    idx = {}
+    for m in top7:
+        for key, price in ((m.home_surname_lc, m.home_price), (m.away_surname_lc, m.away_price)):
+            if price == 'N/A':
+                continue
+            cur = idx.get(key)
+            if cur is None or price < cur[0]:
+                idx[key] = (price, m)
+    return idx
+
+async def check_single_threshold(chat: int, surname: str, thr_price: float, send_func, top7=None):
+    # Callers that already hold a market snapshot can pass it in;
+    # otherwise this is a TTL-cache hit, not a fresh fetch
+    if top7 is None:
+        top7 = await get_top7_markets()
+    hit = build_surname_price_index(top7).get(surname.lower())
+    if hit is not None and hit[0] <= thr_price:
+        await send_func(chat, surname, hit[0], thr_price)
+        return True
     return False
 
 async def send_threshold_alert(chat, surname, price, thr_price):
@@ -191,12 +463,12 @@ async def handle_top(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
 
     # Build a map of current thresholds for quick lookup
     user_thresholds = thresholds.get(chat, [])
-    thr_map = {thr['surname'].lower(): thr['threshold'] for thr in user_thresholds}
+    thr_map = {thr['surname_lc']: thr['threshold'] for thr in user_thresholds}
 
     # fetch markets, but catch authorization or other HTTP errors gracefully
     try:
-        top7 = get_top7_markets()
-    except RequestException as e:
+        top7 = await get_top7_markets()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
         await update.message.reply_text(f"⚠️ Could not retrieve matches: {e}")
         return
 
@@ -205,19 +477,19 @@ async def handle_top(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         await update.message.reply_text("⚠️ No upcoming matches found (or you're not authorized to view them).")
         return
 
-    # List matches
-    for idx, (mkt, dt_utc) in enumerate(top7, start=1):
-        home_full = mkt.get('home_team', 'Unknown')
-        away_full = mkt.get('away_team', 'Unknown')
-        home = format_name(home_full)
-        away = format_name(away_full)
-        dt_local = dt_utc.astimezone(GMT_PLUS_2)
+    # List matches, coalesced into one message to stay clear of
+    # Telegram's per-chat rate limits
+    now_utc = datetime.now(timezone.utc)
+    today_local = now_utc.astimezone(GMT_PLUS_2).date()
+    blocks = []
+    for idx, m in enumerate(top7, start=1):
+        home = format_name(m.home)
+        away = format_name(m.away)
+        dt_local = m.dt_utc.astimezone(GMT_PLUS_2)
         # Mark live matches (commenced in the past)
-        now_utc = datetime.now(timezone.utc)
-        live_flag = " 🔴 LIVE" if dt_utc <= now_utc else ""
+        live_flag = " 🔴 LIVE" if m.dt_utc <= now_utc else ""
 
         # Display “Today” or “Tomorrow” for very near dates
-        today_local = datetime.now(dt_local.tzinfo).date()
         match_date = dt_local.date()
         if match_date == today_local:
             day_str = "Today"
@@ -227,39 +499,27 @@ async def handle_top(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
             day_str = dt_local.strftime('%A')
         time_str = f"{day_str}, {dt_local.strftime('%H:%M')}"
 
-        outcomes = mkt['bookmakers'][0]['markets'][0]['outcomes']
-        home_price = next((o['price'] for o in outcomes if o['name'] == home_full), 'N/A')
-        away_price = next((o['price'] for o in outcomes if o['name'] == away_full), 'N/A')
-
-        # Find exchange odds (lay) from any bookmaker whose key contains "exchange"
-        ex_bk = next((b for b in mkt.get('bookmakers', []) if 'exchange' in b.get('key', '').lower()), None)
-        if ex_bk and ex_bk.get('markets'):
-            ex_outcomes = ex_bk['markets'][0]['outcomes']
-            home_lay = next((o['price'] for o in ex_outcomes if o['name'] == home_full), 'N/A')
-            away_lay = next((o['price'] for o in ex_outcomes if o['name'] == away_full), 'N/A')
-        else:
-            home_lay = away_lay = 'N/A'
-
-        # Count play count for this market
-        play_count = get_play_count(mkt)
+        home_price = m.home_price
+        away_price = m.away_price
 
         # Check if there's a threshold set for these players
-        home_surname = home_full.split()[-1].lower()
-        away_surname = away_full.split()[-1].lower()
-        home_thr = thr_map.get(home_surname)
-        away_thr = thr_map.get(away_surname)
+        home_thr = thr_map.get(m.home_surname_lc)
+        away_thr = thr_map.get(m.away_surname_lc)
 
         # Annotate if threshold exists
         home_annotation = f" (watch <{home_thr})" if home_thr is not None else ""
         away_annotation = f" (watch <{away_thr})" if away_thr is not None else ""
 
-        # Build and send message for each match
-        text = (
+        # Build one block per match
+        blocks.append(
             f"{idx}. *{home} vs {away}*{live_flag} — {time_str}\n"
             f"   • {home}: {home_price}{home_annotation}\n"
             f"   • {away}: {away_price}{away_annotation}"
         )
-        await update.message.reply_text(text, parse_mode='Markdown')
+
+    await update.message.reply_text(
+        "\n\n".join(blocks), parse_mode='Markdown', disable_web_page_preview=True
+    )
 
 # Handler: /setthreshold Surname Price
 async def setthreshold(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -276,20 +536,23 @@ async def setthreshold(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     except ValueError:
         await update.message.reply_text("Invalid price. Use a number like 3.10")
         return
-    thresholds.setdefault(chat, []).append({'surname': surname, 'threshold': price})
-    save_thresholds()
+    async with _thresholds_lock:
+        add_threshold(chat, surname, price)
+        save_thresholds()
     await update.message.reply_text(
         f"Threshold set: *{surname}* < {price}", parse_mode='Markdown'
     )
     await update.message.reply_text(
         "Got it! I'll monitor that player's lay odds and notify you if it dips below your threshold."
     )
-    # Immediately check this threshold now
+    # Immediately check this threshold now, against fresh data
+    invalidate_top7()
     breached = await check_single_threshold(chat, surname, price, send_threshold_alert)
     if breached:
         # If it was already breached, remove it
-        thresholds[chat] = [thr for thr in thresholds[chat] if thr['surname'].lower() != surname.lower()]
-        save_thresholds()
+        async with _thresholds_lock:
+            remove_threshold_entries(chat, surname.lower())
+            save_thresholds()
 
 async def list_thresholds(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat = update.effective_chat.id
@@ -301,8 +564,7 @@ async def list_thresholds(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # Aggregate thresholds per player surname (case-insensitive)
     agg: dict[str, list[float]] = {}
     for thr in user_th:
-        surname_lc = thr['surname'].lower()
-        agg.setdefault(surname_lc, []).append(thr['threshold'])
+        agg.setdefault(thr['surname_lc'], []).append(thr['threshold'])
 
     # Build a single line per player, capitalizing surname and showing all thresholds
     lines = []
@@ -316,12 +578,15 @@ async def list_thresholds(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     text = "Your thresholds:\n" + "\n".join(lines)
     await update.message.reply_text(text, parse_mode='Markdown')
 
+# Compiled once; matched with fullmatch so no anchors are re-evaluated
+REMOVE_RE = re.compile(r'remove\s+([A-Za-z]+)', re.IGNORECASE)
+
 # Handler: /remove Surname
 async def remove_threshold(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat = update.effective_chat.id
     # Determine surname either from slash-command args or plain-text "remove X"
     text = update.message.text.strip()
-    m = re.match(r'(?i)^remove\s+([A-Za-z]+)$', text)
+    m = REMOVE_RE.fullmatch(text)
     if m:
         surname = m.group(1)
     else:
@@ -335,22 +600,42 @@ async def remove_threshold(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     if surname.lower() == 'all':
         return await remove_all(update, context)
 
-    user_th = thresholds.get(chat, [])
-    new_list = [thr for thr in user_th if thr['surname'].lower() != surname.lower()]
-    if len(new_list) == len(user_th):
-        await update.message.reply_text(f"No threshold found for {surname}.")
-    else:
-        thresholds[chat] = new_list
-        save_thresholds()
+    async with _thresholds_lock:
+        removed = remove_threshold_entries(chat, surname.lower())
+        if removed:
+            save_thresholds()
+    if removed:
         await update.message.reply_text(f"Removed threshold for {surname}.")
+    else:
+        await update.message.reply_text(f"No threshold found for {surname}.")
 
 # Handler: clear all thresholds with 'remove all'
 async def remove_all(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat = update.effective_chat.id
-    thresholds.pop(chat, None)
-    save_thresholds()
+    async with _thresholds_lock:
+        remove_all_thresholds(chat)
+        save_thresholds()
     await update.message.reply_text("All thresholds have been removed.")
 
+# Plain-text commands matched once per message by dispatch_text
+TEXT_PATTERN = re.compile(
+    r'(?:(?P<remove_all>remove all)'
+    r'|remove\s+(?P<remove>[A-Za-z]+)'
+    r'|(?P<surname>[A-Za-z]+)\s+(?P<price>\d+(?:\.\d+)?))',
+    re.IGNORECASE,
+)
+
+async def dispatch_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    m = TEXT_PATTERN.fullmatch(update.message.text.strip())
+    if m is None:
+        return
+    if m.group('remove_all'):
+        await remove_all(update, context)
+    elif m.group('remove'):
+        await remove_threshold(update, context)
+    else:
+        await text_threshold(update, context)
+
 # Handler: plain text "Surname Price"
 async def text_threshold(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat = update.effective_chat.id
@@ -363,81 +648,117 @@ async def text_threshold(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         price = float(price_str)
     except ValueError:
         return
-    thresholds.setdefault(chat, []).append({'surname': surname, 'threshold': price})
-    save_thresholds()
+    async with _thresholds_lock:
+        add_threshold(chat, surname, price)
+        save_thresholds()
     await update.message.reply_text(
         f"Threshold set: *{surname}* < {price}", parse_mode='Markdown'
     )
     await update.message.reply_text(
         "Got it! I'll monitor that player's lay odds and notify you if it dips below your threshold."
     )
-    # Immediately check this threshold now
+    # Immediately check this threshold now, against fresh data
+    invalidate_top7()
     breached = await check_single_threshold(chat, surname, price, send_threshold_alert)
     if breached:
-        thresholds[chat] = [thr for thr in thresholds[chat] if thr['surname'].lower() != surname.lower()]
-        save_thresholds()
+        async with _thresholds_lock:
+            remove_threshold_entries(chat, surname.lower())
+            save_thresholds()
 
-import threading
+# Cap concurrent outbound sends below Telegram's ~30 msg/s bot-wide ceiling
+_send_semaphore = asyncio.Semaphore(25)
 
-def threshold_watcher():
-    while True:
+async def send_with_retry(bot, chat_id: int, text: str) -> None:
+    """Send a Markdown message, honouring Telegram's RetryAfter flood control."""
+    async with _send_semaphore:
         try:
+            await bot.send_message(chat_id=chat_id, text=text, parse_mode='Markdown')
+        except RetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            await bot.send_message(chat_id=chat_id, text=text, parse_mode='Markdown')
+
+async def threshold_watcher_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Repeating job: check every stored threshold against the current top 7."""
+    # Nothing to watch — don't burn an Odds API call every tick
+    if not any(thresholds.values()):
+        return
+    try:
+        top7 = await get_top7_markets()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.error(f"Error fetching markets in watcher: {e}")
+        # alert each chat of the problem
+        for chat in list(thresholds):
             try:
-                top7 = get_top7_markets()
-            except RequestException as e:
-                logger.error(f"Error fetching markets in watcher: {e}")
-                # alert each chat of the problem
-                for chat in thresholds:
-                    try:
-                        sync_bot.send_message(
-                            chat_id=chat,
-                            text=f"⚠️ Error retrieving markets: {e}",
-                            parse_mode='Markdown'
-                        )
-                    except Exception as send_exc:
-                        logger.error(f"Failed to send HTTPError alert to chat {chat}: {send_exc}")
-                time.sleep(60)
-                continue
+                await send_with_retry(context.bot, chat, f"⚠️ Error retrieving markets: {e}")
+            except Exception as send_exc:
+                logger.error(f"Failed to send fetch-error alert to chat {chat}: {send_exc}")
+        return
 
-            for chat, user_th in list(thresholds.items()):
-                for thr in list(user_th):
-                    surname = thr['surname'].lower()
-                    thr_price = thr['threshold']
-                    for mkt, _ in top7:
-                        for o in mkt['bookmakers'][0]['markets'][0]['outcomes']:
-                            if o['name'].lower().split()[-1] == surname and o['price'] <= thr_price:
-                                try:
-                                    app.bot.send_message(
-                                        chat_id=chat,
-                                        text=f"⚠️ *{thr['surname']}* odds dropped to {o['price']} (≤ {thr_price})",
-                                        parse_mode='Markdown'
-                                    )
-                                except Exception as e:
-                                    logger.error(f"Threshold alert error: {e}")
-                                thresholds[chat].remove(thr)
-                                save_thresholds()
-                                break
+    price_idx = build_surname_price_index(top7)
+    breaches: dict[int, list[str]] = {}
+    async with _thresholds_lock:
+        for surname_lc, chats in list(_thr_index.items()):
+            hit = price_idx.get(surname_lc)
+            if hit is None:
+                continue
+            for chat, entries in list(chats.items()):
+                for thr in list(entries):
+                    if hit[0] > thr['threshold']:
+                        continue
+                    breaches.setdefault(chat, []).append(
+                        f"• *{thr['surname']}* odds dropped to {hit[0]} (≤ {thr['threshold']})"
+                    )
+                    remove_threshold_entry(chat, thr)
+        # Persist once per tick, however many thresholds were breached
+        if breaches:
+            save_thresholds()
+
+    # One message per chat, no matter how many thresholds were breached
+    for chat, lines in breaches.items():
+        if len(lines) == 1:
+            text = lines[0].replace('• ', '⚠️ ', 1)
+        else:
+            text = "⚠️ Threshold alerts:\n" + "\n".join(lines)
+        try:
+            await send_with_retry(context.bot, chat, text)
         except Exception as e:
-            logger.error(f"Threshold watcher encountered error: {e}", exc_info=e)
-        time.sleep(10)
+            logger.error(f"Threshold alert error: {e}")
 
 # Main entry
 if __name__ == '__main__':
     # CLI test mode: print top 7 matches and exit
     if len(sys.argv) > 1 and sys.argv[1] == '--print':
-        top7 = get_top7_markets()
+        async def _print_top7():
+            global http_session
+            http_session = _make_http_session()
+            try:
+                return await get_top7_markets()
+            finally:
+                await http_session.close()
+        top7 = asyncio.run(_print_top7())
         print("Top 7 Tennis Matches (Next 3 Days):")
-        for idx, (mkt, dt_utc) in enumerate(top7, start=1):
-            outcomes = mkt['bookmakers'][0]['markets'][0]['outcomes']
-            home = format_name(mkt.get('home_team', 'Unknown'))
-            away = format_name(mkt.get('away_team', 'Unknown'))
-            dt_local = dt_utc.astimezone(GMT_PLUS_2)
-            time_str = dt_local.strftime('%H:%M')
+        for idx, m in enumerate(top7, start=1):
+            home = format_name(m.home)
+            away = format_name(m.away)
+            time_str = m.dt_utc.astimezone(GMT_PLUS_2).strftime('%H:%M')
             print(f"{idx}. {home} vs {away} — {time_str}")
-            print(f"   • {home}: {next((o['price'] for o in outcomes if o['name']==mkt.get('home_team', 'Unknown')), 'N/A')}")
-            print(f"   • {away}: {next((o['price'] for o in outcomes if o['name']==mkt.get('away_team', 'Unknown')), 'N/A')}")
+            print(f"   • {home}: {m.home_price}")
+            print(f"   • {away}: {m.away_price}")
         sys.exit(0)
-    app = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+    # Larger pools + concurrent updates so parallel handlers don't
+    # starve waiting for an outbound connection
+    app = (
+        ApplicationBuilder()
+        .token(TELEGRAM_TOKEN)
+        .concurrent_updates(True)
+        .connection_pool_size(64)
+        .pool_timeout(20)
+        .get_updates_connection_pool_size(16)
+        .get_updates_pool_timeout(60)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
     # Register /t10t and /top10tennis commands separately
     app.add_handler(CommandHandler('t10t', handle_top))
     app.add_handler(CommandHandler('top10tennis', handle_top))
@@ -445,19 +766,19 @@ if __name__ == '__main__':
     app.add_handler(CommandHandler('thresholds', list_thresholds))
     app.add_handler(CommandHandler('remove', remove_threshold))
     app.add_handler(CommandHandler('removeall', remove_all))
-    # plain text handler to remove a single player threshold without slash
-    app.add_handler(MessageHandler(filters.Regex(r'(?i)^remove\s+[A-Za-z]+$'), remove_threshold))
-    # plain text handlers
-    app.add_handler(MessageHandler(filters.Regex(r'^[A-Za-z]+ \d+(?:\.\d+)?$'), text_threshold))
-    app.add_handler(MessageHandler(filters.Regex(r'(?i)^remove all$'), remove_all))
+    # plain text handlers: one dispatcher, one anchored pattern match per message
+    app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, dispatch_text))
     load_thresholds()
-    # Start background watcher thread for thresholds
-    threading.Thread(target=threshold_watcher, daemon=True).start()
+    # Schedule the repeating threshold watcher on the event loop
+    app.job_queue.run_repeating(threshold_watcher_job, interval=10, first=5)
+    # Drain pending threshold writes to git at most once per 5 minutes
+    app.job_queue.run_repeating(git_push_job, interval=300, first=300)
     # Global error handler to catch uncaught exceptions in handlers
     async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         logger.error(f"Exception while handling update {update}: {context.error}", exc_info=context.error)
 
     app.add_error_handler(error_handler)
     logger.info("Bot started and polling...")
-    app.run_polling()
+    # only message updates are handled, so don't ask Telegram for the rest
+    app.run_polling(allowed_updates=["message"])
 